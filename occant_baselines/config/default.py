@@ -160,6 +160,8 @@ _C.RL.ANS.OCCUPANCY_ANTICIPATOR.GP_ANTICIPATION.resnet_type = "resnet18"
 _C.RL.ANS.OCCUPANCY_ANTICIPATOR.GP_ANTICIPATION.detach_depth_proj = False
 _C.RL.ANS.OCCUPANCY_ANTICIPATOR.GP_ANTICIPATION.pretrained_depth_proj_model = ""
 _C.RL.ANS.OCCUPANCY_ANTICIPATOR.GP_ANTICIPATION.freeze_depth_proj_model = False
+# ANS RGB decoder upsampling: bilinear / transposed_conv
+_C.RL.ANS.OCCUPANCY_ANTICIPATOR.GP_ANTICIPATION.ans_rgb_upsampling = "bilinear"
 # Normalization options for anticipation output
 _C.RL.ANS.OCCUPANCY_ANTICIPATOR.GP_ANTICIPATION.OUTPUT_NORMALIZATION = CN()
 _C.RL.ANS.OCCUPANCY_ANTICIPATOR.GP_ANTICIPATION.OUTPUT_NORMALIZATION.channel_0 = (
@@ -12,11 +12,7 @@ import torch.nn as nn
 
 from einops import rearrange
 
-from occant_utils.common import (
-    dilate_tensor,
-    erode_tensor,
-    morphology_close,
-)
+from occant_utils.common import dilate_tensor
 
 
 def ground_projection(img_feats, spatial_locs, valid_inputs, local_shape, K, eps=-1e16):
@@ -49,9 +45,6 @@ def ground_projection(img_feats, spatial_locs, valid_inputs, local_shape, K, eps
     valid_inputs_depth = valid_inputs_depth.squeeze(1)  # (bs, HbyK, WbyK)
     invalid_inputs_depth = ~valid_inputs_depth
 
-    output_feats = torch.zeros(bs, F, outh, outw).to(device)
-    output_feats.fill_(eps)
-    output_feats_rshp = output_feats.view(*output_feats.shape[:2], -1)
     input_idxes_flip = torch.flip(input_idxes, [1])  # convert x, y to y, x
 
     invalid_writes = (
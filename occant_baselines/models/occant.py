@@ -17,15 +17,39 @@ from occant_baselines.models.unet import (
     MergeMultimodal,
     ResNetRGBEncoder,
 )
+from occant_baselines.models.utils import (
+    fuse_conv_bn,
+    script_submodules,
+    to_channels_last,
+)
 
 
 def softmax_2d(x):
-    b, h, w = x.shape
-    x_out = F.softmax(rearrange(x, "b h w -> b (h w)"), dim=1)
-    x_out = rearrange(x_out, "b (h w) -> b h w", h=h)
+    """
+    Spatial softmax computed independently for each channel.
+    Inputs:
+        x - (bs, C, H, W)
+    """
+    b, c, h, w = x.shape
+    x_out = F.softmax(x.reshape(b, c, h * w), dim=2)
+    x_out = x_out.view(b, c, h, w)
     return x_out
 
 
+def build_unet(nsf, nclasses):
+    """
+    Builds the UNet encoder and decoder that map the (bs, 2, H, W) projected
+    occupancy to (bs, nclasses, H, W) anticipated occupancy.
+    """
+    return UNetEncoder(2, nsf=nsf), UNetDecoder(nclasses, nsf=nsf)
+
+
+OUTPUT_NORMALIZATIONS = {
+    "sigmoid": torch.sigmoid,
+    "softmax": softmax_2d,
+}
+
+
 # ================================ Anticipation base ==================================
 
 
@@ -34,15 +58,9 @@ class BaseModel(nn.Module):
         super().__init__()
         self.config = cfg
 
-        if cfg.GP_ANTICIPATION.OUTPUT_NORMALIZATION.channel_0 == "sigmoid":
-            self.normalize_channel_0 = torch.sigmoid
-        elif cfg.GP_ANTICIPATION.OUTPUT_NORMALIZATION.channel_0 == "softmax":
-            self.normalize_channel_0 = softmax_0d
-
-        if cfg.GP_ANTICIPATION.OUTPUT_NORMALIZATION.channel_1 == "sigmoid":
-            self.normalize_channel_1 = torch.sigmoid
-        elif cfg.GP_ANTICIPATION.OUTPUT_NORMALIZATION.channel_1 == "softmax":
-            self.normalize_channel_1 = softmax_2d
+        norm_cfg = cfg.GP_ANTICIPATION.OUTPUT_NORMALIZATION
+        self.normalize_channel_0 = self._get_normalization(norm_cfg.channel_0)
+        self.normalize_channel_1 = self._get_normalization(norm_cfg.channel_1)
 
         self._create_gp_models()
 
@@ -53,6 +71,20 @@ class BaseModel(nn.Module):
 
         return final_outputs
 
+    @staticmethod
+    def _get_normalization(norm_type):
+        if norm_type not in OUTPUT_NORMALIZATIONS:
+            raise ValueError(f"Invalid output normalization {norm_type}")
+        return OUTPUT_NORMALIZATIONS[norm_type]
+
+    def fuse_for_inference(self):
+        """
+        Folds the BatchNorm layers into their preceding convolutions. The folded
+        model can only be used for inference, so it is switched to eval mode.
+        """
+        self.eval()
+        fuse_conv_bn(self)
+
     def _create_gp_models(self):
         raise NotImplementedError
 
@@ -60,9 +92,12 @@ class BaseModel(nn.Module):
         raise NotImplementedError
 
     def _normalize_decoder_output(self, x_dec):
-        x_dec_c0 = self.normalize_channel_0(x_dec[:, 0])
-        x_dec_c1 = self.normalize_channel_1(x_dec[:, 1])
-        return torch.stack([x_dec_c0, x_dec_c1], dim=1)
+        # Normalize all channels in one call when they share the same normalization
+        if self.normalize_channel_0 is self.normalize_channel_1:
+            return self.normalize_channel_0(x_dec[:, :2])
+        x_dec_c0 = self.normalize_channel_0(x_dec[:, 0:1])
+        x_dec_c1 = self.normalize_channel_1(x_dec[:, 1:2])
+        return torch.cat([x_dec_c0, x_dec_c1], dim=1)
 
 
 # ============================= Anticipation models ===================================
@@ -74,8 +109,15 @@ class ANSRGB(BaseModel):
     """
 
     def _create_gp_models(self):
+        gp_cfg = self.config.GP_ANTICIPATION
+        upsampling = (
+            gp_cfg.ans_rgb_upsampling
+            if hasattr(gp_cfg, "ans_rgb_upsampling")
+            else "bilinear"
+        )
+
         resnet = tmodels.resnet18(pretrained=True)
-        self.main = nn.Sequential(  # (3, 128, 128)
+        encoder = [  # (3, 128, 128)
             # Feature extraction
             resnet.conv1,
             resnet.bn1,
@@ -88,44 +130,72 @@ class ANSRGB(BaseModel):
             # FC layers equivalent
             nn.Conv2d(512, 512, 1),  # (512, 4, 4)
             nn.BatchNorm2d(512),
-            nn.ReLU(),
+            nn.ReLU(inplace=True),
             nn.Conv2d(512, 512, 1),  # (512, 4, 4)
             nn.BatchNorm2d(512),
-            nn.ReLU(),
-            # Upsampling
-            nn.Conv2d(512, 256, 3, padding=1),  # (256, 4, 4)
-            nn.BatchNorm2d(256),
-            nn.ReLU(),
-            nn.Upsample(
-                scale_factor=2, mode="bilinear", align_corners=True
-            ),  # (256, 8, 8)
-            nn.Conv2d(256, 128, 3, padding=1),  # (128, 8, 8)
-            nn.BatchNorm2d(128),
-            nn.ReLU(),
-            nn.Upsample(
-                scale_factor=2, mode="bilinear", align_corners=True
-            ),  # (128, 16, 16),
-            nn.Conv2d(128, 64, 3, padding=1),  # (64, 16, 16)
-            nn.BatchNorm2d(64),
-            nn.ReLU(),
-            nn.Upsample(
-                scale_factor=2, mode="bilinear", align_corners=True
-            ),  # (64, 32, 32),
-            nn.Conv2d(64, 32, 3, padding=1),  # (32, 32, 32)
-            nn.BatchNorm2d(32),
-            nn.ReLU(),
-            nn.Upsample(
-                scale_factor=2, mode="bilinear", align_corners=True
-            ),  # (32, 64, 64),
-            nn.Conv2d(32, 2, 3, padding=1),  # (2, 64, 64)
-            nn.Upsample(
-                scale_factor=2, mode="bilinear", align_corners=True
-            ),  # (2, 128, 128),
-        )
+            nn.ReLU(inplace=True),
+        ]
+        if upsampling == "bilinear":
+            decoder = [
+                # Upsampling
+                nn.Conv2d(512, 256, 3, padding=1),  # (256, 4, 4)
+                nn.BatchNorm2d(256),
+                nn.ReLU(inplace=True),
+                nn.Upsample(
+                    scale_factor=2, mode="bilinear", align_corners=True
+                ),  # (256, 8, 8)
+                nn.Conv2d(256, 128, 3, padding=1),  # (128, 8, 8)
+                nn.BatchNorm2d(128),
+                nn.ReLU(inplace=True),
+                nn.Upsample(
+                    scale_factor=2, mode="bilinear", align_corners=True
+                ),  # (128, 16, 16),
+                nn.Conv2d(128, 64, 3, padding=1),  # (64, 16, 16)
+                nn.BatchNorm2d(64),
+                nn.ReLU(inplace=True),
+                nn.Upsample(
+                    scale_factor=2, mode="bilinear", align_corners=True
+                ),  # (64, 32, 32),
+                nn.Conv2d(64, 32, 3, padding=1),  # (32, 32, 32)
+                nn.BatchNorm2d(32),
+                nn.ReLU(inplace=True),
+                nn.Upsample(
+                    scale_factor=2, mode="bilinear", align_corners=True
+                ),  # (32, 64, 64),
+                nn.Conv2d(32, 2, 3, padding=1),  # (2, 64, 64)
+                nn.Upsample(
+                    scale_factor=2, mode="bilinear", align_corners=True
+                ),  # (2, 128, 128),
+            ]
+        elif upsampling == "transposed_conv":
+            # Each conv + bilinear upsampling pair is replaced by a single
+            # strided transposed convolution.
+            decoder = [
+                # Upsampling
+                nn.ConvTranspose2d(512, 256, 4, stride=2, padding=1),  # (256, 8, 8)
+                nn.BatchNorm2d(256),
+                nn.ReLU(inplace=True),
+                nn.ConvTranspose2d(256, 128, 4, stride=2, padding=1),  # (128, 16, 16)
+                nn.BatchNorm2d(128),
+                nn.ReLU(inplace=True),
+                nn.ConvTranspose2d(128, 64, 4, stride=2, padding=1),  # (64, 32, 32)
+                nn.BatchNorm2d(64),
+                nn.ReLU(inplace=True),
+                nn.ConvTranspose2d(64, 32, 4, stride=2, padding=1),  # (32, 64, 64)
+                nn.BatchNorm2d(32),
+                nn.ReLU(inplace=True),
+                nn.ConvTranspose2d(32, 2, 4, stride=2, padding=1),  # (2, 128, 128)
+            ]
+        else:
+            raise ValueError(f"ANSRGB: Undefined upsampling type {upsampling}!")
+
+        self.main = nn.Sequential(*encoder, *decoder)
+        self.main = to_channels_last(self.main)
 
     def _do_gp_anticipation(self, x):
-        x_dec = self.main(x["rgb"])
-        x_dec = self._normalize_decoder_output(x_dec)
+        x_dec = self.main(to_channels_last(x["rgb"]))
+        # Return standard NCHW maps, the channels-last format is internal
+        x_dec = self._normalize_decoder_output(x_dec).contiguous()
         outputs = {"occ_estimate": x_dec}
 
         return outputs
@@ -208,37 +278,79 @@ class OccAntRGB(BaseModel):
         x_rgb = self.gp_rgb_encoder(x["rgb"])  # (bs, 768, H/8, W/8)
         x_gp = self.gp_rgb_projector(x_rgb)  # (bs, 768, H/4, W/4)
 
-        x_rgb_enc = self.gp_rgb_unet(x_gp)  # {'x3p', 'x4p', 'x5p'}
+        x_rgb_enc = self.gp_rgb_unet(x_gp)  # (x3p, x4p, x5p)
         # Estimate projected occupancy
         x_depth_proj = self.gp_depth_proj_estimator(x)["occ_estimate"]  # (bs, 2, V, V)
         if self._detach_depth_proj:
             x_depth_proj_enc = self.gp_depth_proj_encoder(
                 x_depth_proj.detach()
-            )  # {'x1', 'x2', 'x3', 'x4', 'x5'}
+            )  # (x1, x2, x3, x4, x5)
         else:
             x_depth_proj_enc = self.gp_depth_proj_encoder(
                 x_depth_proj
-            )  # {'x1', 'x2', 'x3', 'x4', 'x5'}
+            )  # (x1, x2, x3, x4, x5)
 
         # Replace x_depth_proj_enc with merged features
-        x5_inputs = [x_rgb_enc["x5p"], x_depth_proj_enc["x5"]]
-        x4_inputs = [x_rgb_enc["x4p"], x_depth_proj_enc["x4"]]
-        x3_inputs = [x_rgb_enc["x3p"], x_depth_proj_enc["x3"]]
+        x5_inputs = torch.cat([x_rgb_enc.x5p, x_depth_proj_enc.x5], dim=1)
+        x4_inputs = torch.cat([x_rgb_enc.x4p, x_depth_proj_enc.x4], dim=1)
+        x3_inputs = torch.cat([x_rgb_enc.x3p, x_depth_proj_enc.x3], dim=1)
 
-        x5_enc = self.gp_merge_x5(*x5_inputs)  # (unet_feat_size  , H/16, H/16)
-        x4_enc = self.gp_merge_x4(*x4_inputs)  # (unet_feat_size  , H/8 , H/8 )
-        x3_enc = self.gp_merge_x3(*x3_inputs)  # (unet_feat_size/2, H/4 , H/4 )
-        x_depth_proj_enc["x5"] = x5_enc
-        x_depth_proj_enc["x4"] = x4_enc
-        x_depth_proj_enc["x3"] = x3_enc
+        x5_enc = self.gp_merge_x5(x5_inputs)  # (nsf*8, H/16, H/16)
+        x4_enc = self.gp_merge_x4(x4_inputs)  # (nsf*8, H/8 , H/8 )
+        x3_enc = self.gp_merge_x3(x3_inputs)  # (nsf*4, H/4 , H/4 )
+        x_depth_proj_enc = x_depth_proj_enc._replace(x5=x5_enc, x4=x4_enc, x3=x3_enc)
 
         x_dec = self.gp_decoder(x_depth_proj_enc)
-        x_dec = self._normalize_decoder_output(x_dec)  # (bs, 2, H, W)
+        # Return standard NCHW maps, the channels-last format is internal
+        x_dec = self._normalize_decoder_output(x_dec).contiguous()  # (bs, 2, H, W)
 
         outputs = {"depth_proj_estimate": x_depth_proj, "occ_estimate": x_dec}
 
         return outputs
 
+    def quantize_depth_proj_estimator(self, calibration_batches):
+        """
+        Applies post-training static INT8 quantization to the frozen depth-projection
+        estimator. The quantized estimator only runs on the CPU, so this is meant for
+        CPU rollout workers. Call this after loading the trained weights and moving
+        the model to the CPU, and before prepare_for_inference().
+        Inputs:
+            calibration_batches - iterable of (bs, 3, H, W) normalized RGB inputs
+                                  used to calibrate the activation ranges
+        """
+        if not self.config.GP_ANTICIPATION.freeze_depth_proj_model:
+            raise ValueError(
+                "OccAntRGB: Only a frozen depth projection model can be quantized!"
+            )
+        estimator = self.gp_depth_proj_estimator
+        if isinstance(estimator, torch.jit.ScriptModule) or isinstance(
+            estimator.main, torch.jit.ScriptModule
+        ):
+            raise ValueError(
+                "OccAntRGB: The depth projection model must be quantized before "
+                "prepare_for_inference() scripts it!"
+            )
+        if any(p.device.type != "cpu" for p in self.parameters()):
+            raise ValueError(
+                "OccAntRGB: The quantized depth projection model only runs on the "
+                "CPU. Move the model to the CPU with .cpu() before quantizing it!"
+            )
+        calibration_batches = [x_rgb.cpu() for x_rgb in calibration_batches]
+        if len(calibration_batches) == 0:
+            raise ValueError("OccAntRGB: At least one calibration batch is needed!")
+
+        from torch.ao.quantization import get_default_qconfig_mapping
+        from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+        estimator.eval()
+        main = prepare_fx(
+            estimator.main, get_default_qconfig_mapping(), calibration_batches[:1]
+        )
+        with torch.no_grad():
+            for x_rgb in calibration_batches:
+                main(to_channels_last(x_rgb))
+        estimator.main = convert_fx(main)
+
     def _load_pretrained_model(self, path):
         depth_proj_state_dict = torch.load(
             self.config.GP_ANTICIPATION.pretrained_depth_proj_model, map_location="cpu"
@@ -263,8 +375,7 @@ class OccAntDepth(BaseModel):
 
         # Compute constants
         nsf = gp_cfg.unet_nsf
-        unet_encoder = UNetEncoder(2, nsf=nsf)
-        unet_decoder = UNetDecoder(gp_cfg.nclasses, nsf=nsf)
+        unet_encoder, unet_decoder = build_unet(nsf, gp_cfg.nclasses)
         unet_feat_size = nsf * 8
         self.gp_depth_proj_encoder = unet_encoder
         self.gp_decoder = unet_decoder
@@ -275,9 +386,7 @@ class OccAntDepth(BaseModel):
             x is a dictionary containing the following keys:
                 'ego_map_gt' - (bs, 2, H, W) input
         """
-        x_enc = self.gp_depth_proj_encoder(
-            x["ego_map_gt"]
-        )  # dictionary with different outputs
+        x_enc = self.gp_depth_proj_encoder(x["ego_map_gt"])  # (x1, x2, x3, x4, x5)
         x_dec = self.gp_decoder(x_enc)  # (bs, 2, H, W)
         x_dec = self._normalize_decoder_output(x_dec)
 
@@ -301,8 +410,7 @@ class OccAntRGBD(BaseModel):
         )
         infeats = 768 if resnet_type == "resnet50" else 192
         nsf = gp_cfg.unet_nsf
-        unet_encoder = UNetEncoder(2, nsf=nsf)
-        unet_decoder = UNetDecoder(gp_cfg.nclasses, nsf=nsf)
+        unet_encoder, unet_decoder = build_unet(nsf, gp_cfg.nclasses)
         unet_feat_size = nsf * 8
 
         # RGB encoder branch
@@ -335,22 +443,20 @@ class OccAntRGBD(BaseModel):
         x_rgb = self.gp_rgb_encoder(x["rgb"])  # (bs, infeats, H/8, W/8)
         x_gp = self.gp_rgb_projector(x_rgb)  # (bs, infeats, H/4, W/4)
 
-        x_rgb_enc = self.gp_rgb_unet(x_gp)  # {'x3p', 'x4p', 'x5p'}
+        x_rgb_enc = self.gp_rgb_unet(x_gp)  # (x3p, x4p, x5p)
         x_depth_proj_enc = self.gp_depth_proj_encoder(
             x["ego_map_gt"]
-        )  # {'x1', 'x2', 'x3', 'x4', 'x5'}
+        )  # (x1, x2, x3, x4, x5)
 
         # Replace x_depth_proj_enc with merged features
-        x5_inputs = [x_rgb_enc["x5p"], x_depth_proj_enc["x5"]]
-        x4_inputs = [x_rgb_enc["x4p"], x_depth_proj_enc["x4"]]
-        x3_inputs = [x_rgb_enc["x3p"], x_depth_proj_enc["x3"]]
+        x5_inputs = torch.cat([x_rgb_enc.x5p, x_depth_proj_enc.x5], dim=1)
+        x4_inputs = torch.cat([x_rgb_enc.x4p, x_depth_proj_enc.x4], dim=1)
+        x3_inputs = torch.cat([x_rgb_enc.x3p, x_depth_proj_enc.x3], dim=1)
 
-        x5_enc = self.gp_merge_x5(*x5_inputs)  # (unet_feat_size  , H/16, H/16)
-        x4_enc = self.gp_merge_x4(*x4_inputs)  # (unet_feat_size  , H/8 , H/8 )
-        x3_enc = self.gp_merge_x3(*x3_inputs)  # (unet_feat_size/2, H/4 , H/4 )
-        x_depth_proj_enc["x5"] = x5_enc
-        x_depth_proj_enc["x4"] = x4_enc
-        x_depth_proj_enc["x3"] = x3_enc
+        x5_enc = self.gp_merge_x5(x5_inputs)  # (nsf*8, H/16, H/16)
+        x4_enc = self.gp_merge_x4(x4_inputs)  # (nsf*8, H/8 , H/8 )
+        x3_enc = self.gp_merge_x3(x3_inputs)  # (nsf*4, H/4 , H/4 )
+        x_depth_proj_enc = x_depth_proj_enc._replace(x5=x5_enc, x4=x4_enc, x3=x3_enc)
 
         x_dec = self.gp_decoder(x_depth_proj_enc)  # (bs, 2, H, W)
         x_dec = self._normalize_decoder_output(x_dec)
@@ -375,6 +481,16 @@ class OccAntGroundTruth(BaseModel):
         return outputs
 
 
+ANTICIPATION_MODELS = {
+    "ans_rgb": ANSRGB,
+    "ans_depth": ANSDepth,
+    "occant_rgb": OccAntRGB,
+    "occant_depth": OccAntDepth,
+    "occant_rgbd": OccAntRGBD,
+    "occant_ground_truth": OccAntGroundTruth,
+}
+
+
 # ================================ Occupancy anticipator ==============================
 
 
@@ -384,26 +500,37 @@ class OccupancyAnticipator(nn.Module):
         self.config = cfg
         model_type = cfg.type
         self._model_type = model_type
-        cfg.defrost()
-        if model_type == "ans_rgb":
-            self.main = ANSRGB(cfg)
-        elif model_type == "ans_depth":
-            self.main = ANSDepth(cfg)
-        elif model_type == "occant_rgb":
-            self.main = OccAntRGB(cfg)
-        elif model_type == "occant_depth":
-            self.main = OccAntDepth(cfg)
-        elif model_type == "occant_rgbd":
-            self.main = OccAntRGBD(cfg)
-        elif model_type == "occant_ground_truth":
-            self.main = OccAntGroundTruth(cfg)
-        else:
+        if model_type not in ANTICIPATION_MODELS:
             raise ValueError(f"Invalid model_type {model_type}")
-
+        cfg.defrost()
+        self.main = ANTICIPATION_MODELS[model_type](cfg)
         cfg.freeze()
 
+        # The input and output sizes are fixed, so let cuDNN autotune the conv
+        # algorithms once, unless deterministic behavior was requested.
+        if not torch.backends.cudnn.deterministic:
+            torch.backends.cudnn.benchmark = True
+
     def forward(self, x):
-        return self.main(x)
+        if self.training:
+            return self.main(x)
+        # The anticipator is only evaluated without gradients in eval mode, so skip
+        # autograd tracking. no_grad is used instead of inference_mode since callers
+        # update the outputs in-place.
+        with torch.no_grad():
+            return self.main(x)
+
+    def prepare_for_inference(self):
+        """
+        Switches to eval mode, folds the BatchNorm layers and compiles the model
+        with TorchScript where possible. Call this after load_state_dict() and after
+        moving the model to its device. The prepared model cannot be trained or
+        checkpointed anymore.
+        """
+        self.main.fuse_for_inference()
+        self.eval()
+        if hasattr(torch.jit, "freeze"):
+            script_submodules(self.main)
 
     @property
     def use_gp_anticipation(self):
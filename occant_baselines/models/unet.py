@@ -4,11 +4,14 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
+from typing import NamedTuple
+
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
 import torchvision.models as tmodels
 
+from occant_baselines.models.utils import to_channels_last
 
 # =========================== Sub-parts of the U-Net model ============================
 
@@ -94,6 +97,20 @@ class outconv(nn.Module):
 # =================================== Component modules ===============================
 
 
+class UNetFeatures(NamedTuple):
+    x1: torch.Tensor  # (bs, nsf, ..., ...)
+    x2: torch.Tensor  # (bs, nsf*2, ..., ...)
+    x3: torch.Tensor  # (bs, nsf*4, ..., ...)
+    x4: torch.Tensor  # (bs, nsf*8, ..., ...)
+    x5: torch.Tensor  # (bs, nsf*8, ..., ...)
+
+
+class MiniUNetFeatures(NamedTuple):
+    x3p: torch.Tensor  # (bs, feat_size/2, ..., ...)
+    x4p: torch.Tensor  # (bs, feat_size, ..., ...)
+    x5p: torch.Tensor  # (bs, feat_size, ..., ...)
+
+
 class UNetEncoder(nn.Module):
     def __init__(self, n_channels, nsf=16):
         super().__init__()
@@ -110,7 +127,7 @@ class UNetEncoder(nn.Module):
         x4 = self.down3(x3)  # (bs, nsf*8, ..., ...)
         x5 = self.down4(x4)  # (bs, nsf*8, ..., ...)
 
-        return {"x1": x1, "x2": x2, "x3": x3, "x4": x4, "x5": x5}
+        return UNetFeatures(x1, x2, x3, x4, x5)
 
 
 class UNetDecoder(nn.Module):
@@ -122,16 +139,16 @@ class UNetDecoder(nn.Module):
         self.up4 = up(nsf * 2, nsf)
         self.outc = outconv(nsf, n_classes)
 
-    def forward(self, xin):
+    def forward(self, xin: UNetFeatures):
         """
-        xin is a dictionary that consists of x1, x2, x3, x4, x5 keys
+        xin is the UNetFeatures tuple of x1, x2, x3, x4, x5 features
         from the UNetEncoder
         """
-        x1 = xin["x1"]  # (bs, nsf, ..., ...)
-        x2 = xin["x2"]  # (bs, nsf*2, ..., ...)
-        x3 = xin["x3"]  # (bs, nsf*4, ..., ...)
-        x4 = xin["x4"]  # (bs, nsf*8, ..., ...)
-        x5 = xin["x5"]  # (bs, nsf*8, ..., ...)
+        x1 = xin.x1  # (bs, nsf, ..., ...)
+        x2 = xin.x2  # (bs, nsf*2, ..., ...)
+        x3 = xin.x3  # (bs, nsf*4, ..., ...)
+        x4 = xin.x4  # (bs, nsf*8, ..., ...)
+        x5 = xin.x5  # (bs, nsf*8, ..., ...)
 
         x = self.up1(x5, x4)  # (bs, nsf*4, ..., ...)
         x = self.up2(x, x3)  # (bs, nsf*2, ..., ...)
@@ -158,7 +175,7 @@ class MiniUNetEncoder(nn.Module):
         x4p = self.down3p(x3p)
         x5p = self.down4p(x4p)
 
-        return {"x3p": x3p, "x4p": x4p, "x5p": x5p}
+        return MiniUNetFeatures(x3p, x4p, x5p)
 
 
 class LearnedRGBProjection(nn.Module):
@@ -168,10 +185,10 @@ class LearnedRGBProjection(nn.Module):
             self.projection = nn.Sequential(  # (bs, infeats, H, W)
                 nn.Conv2d(infeats, infeats, 3, stride=1, padding=1),
                 nn.BatchNorm2d(infeats),
-                nn.ReLU(),
+                nn.ReLU(inplace=True),
                 nn.Conv2d(infeats, infeats, 5, stride=1, padding=2),
                 nn.BatchNorm2d(infeats),
-                nn.ReLU(),
+                nn.ReLU(inplace=True),
                 nn.MaxPool2d(2),
                 nn.Conv2d(
                     infeats, infeats, 5, stride=1, padding=2
@@ -181,10 +198,10 @@ class LearnedRGBProjection(nn.Module):
             self.projection = nn.Sequential(  # (bs, infeats, H, W)
                 nn.Conv2d(infeats, infeats, 3, stride=1, padding=1),
                 nn.BatchNorm2d(infeats),
-                nn.ReLU(),
+                nn.ReLU(inplace=True),
                 nn.Conv2d(infeats, infeats, 5, stride=1, padding=2),
                 nn.BatchNorm2d(infeats),
-                nn.ReLU(),
+                nn.ReLU(inplace=True),
                 nn.Upsample(
                     scale_factor=2, mode="bilinear", align_corners=True
                 ),  # (bs, infeats, H*2, W*2)
@@ -211,19 +228,20 @@ class MergeMultimodal(nn.Module):
         self.merge = nn.Sequential(
             nn.Conv2d(nmodes * nfeats, nfeats, 3, stride=1, padding=1),
             nn.BatchNorm2d(nfeats),
-            nn.ReLU(),
+            nn.ReLU(inplace=True),
             nn.Conv2d(nfeats, nfeats, 3, stride=1, padding=1),
             nn.BatchNorm2d(nfeats),
-            nn.ReLU(),
+            nn.ReLU(inplace=True),
             nn.Conv2d(nfeats, nfeats, 3, stride=1, padding=1),
         )
 
     def forward(self, *inputs):
         """
         Inputs:
-            xi - (bs, nfeats, H, W)
+            xi - (bs, nfeats, H, W), or a single (bs, nmodes * nfeats, H, W) input
+                 with the modalities already concatenated along the channels
         """
-        x = torch.cat(inputs, dim=1)
+        x = inputs[0] if len(inputs) == 1 else torch.cat(inputs, dim=1)
         return self.merge(x)
 
 
@@ -246,13 +264,14 @@ class ResNetRGBEncoder(nn.Module):
         )
         self.resnet_block1 = resnet.layer1  # (256, H/4, W/4)
         self.resnet_block2 = resnet.layer2  # (512, H/8, W/8)
+        to_channels_last(self)
 
     def forward(self, x):
         """
         Inputs:
             x - RGB image of size (bs, 3, H, W)
         """
-        x_base = self.resnet_base(x)
+        x_base = self.resnet_base(to_channels_last(x))
         x_block1 = self.resnet_block1(x_base)
         x_block2 = self.resnet_block2(x_block1)
         x_block1_red = F.avg_pool2d(
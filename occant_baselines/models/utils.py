@@ -4,14 +4,14 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
-import numpy as np
+import inspect
 
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
-import torchvision.models as tmodels
 
-from einops import rearrange, reduce, repeat, asnumpy
+from einops import repeat
+from torchvision.models.resnet import BasicBlock, Bottleneck
 
 
 def crop_map(h, x, crop_size, mode="bilinear"):
@@ -58,3 +58,70 @@ def crop_map(h, x, crop_size, mode="bilinear"):
     h_cropped = F.grid_sample(h, crop_grid, mode=mode)
 
     return h_cropped
+
+
+def to_channels_last(x):
+    r"""
+    Converts the 4D parameters of a module, or a (bs, C, H, W) tensor, to the
+    channels-last memory format so that cuDNN can use its NHWC convolution kernels.
+    This is a no-op on PyTorch versions without channels-last support.
+    """
+    if not hasattr(torch, "channels_last"):
+        return x
+    if isinstance(x, nn.Module):
+        return x.to(memory_format=torch.channels_last)
+    return x.contiguous(memory_format=torch.channels_last)
+
+
+def fuse_conv_bn(module):
+    r"""
+    Recursively folds every BatchNorm2d layer into the Conv2d or ConvTranspose2d
+    layer that directly precedes it, and replaces the BatchNorm2d layer with an
+    identity. Conv-BN pairs are detected inside nn.Sequential containers and
+    torchvision ResNet blocks. ConvTranspose2d layers are only folded on PyTorch
+    versions that support it. The module must be in eval mode since the running
+    statistics are folded.
+    """
+    from torch.nn.utils.fusion import fuse_conv_bn_eval
+
+    can_fuse_transpose = "transpose" in inspect.signature(fuse_conv_bn_eval).parameters
+
+    for child in module.children():
+        fuse_conv_bn(child)
+
+    if isinstance(module, nn.Sequential):
+        names = list(module._modules.keys())
+        conv_bn_pairs = zip(names[:-1], names[1:])
+    elif isinstance(module, (BasicBlock, Bottleneck)):
+        conv_bn_pairs = [
+            (f"conv{i}", f"bn{i}") for i in range(1, 4) if hasattr(module, f"conv{i}")
+        ]
+    else:
+        return
+
+    for conv_name, bn_name in conv_bn_pairs:
+        conv = module._modules[conv_name]
+        bn = module._modules[bn_name]
+        if not isinstance(bn, nn.BatchNorm2d):
+            continue
+        if isinstance(conv, nn.Conv2d):
+            module._modules[conv_name] = fuse_conv_bn_eval(conv, bn)
+        elif isinstance(conv, nn.ConvTranspose2d) and can_fuse_transpose:
+            module._modules[conv_name] = fuse_conv_bn_eval(conv, bn, transpose=True)
+        else:
+            continue
+        module._modules[bn_name] = nn.Identity()
+
+
+def script_submodules(module):
+    r"""
+    Replaces each child of module with a frozen TorchScript version of it. Children
+    that cannot be scripted are left as they are and their own children are scripted
+    instead. The module must be in eval mode and on its final device since freezing
+    inlines the parameters as constants.
+    """
+    for name, child in list(module.named_children()):
+        try:
+            module._modules[name] = torch.jit.freeze(torch.jit.script(child))
+        except Exception:
+            script_submodules(child)
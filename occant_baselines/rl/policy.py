@@ -11,12 +11,12 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 
-from gym import spaces
 from occant_utils.common import (
     add_pose,
     crop_map,
     subtract_pose,
     process_image,
+    get_img_normalization,
     transpose_image,
     bottom_row_padding,
     bottom_row_cropping,
@@ -266,10 +266,11 @@ class Mapper(nn.Module):
 
     def predict_deltas(self, x, masks=None):
         # Transpose multichannel inputs
-        st_1 = process_image(x["rgb_at_t_1"], self.img_mean_t, self.img_std_t)
+        img_mean_t, img_std_t = get_img_normalization(self, x["rgb_at_t"].device)
+        st_1 = process_image(x["rgb_at_t_1"], img_mean_t, img_std_t)
         dt_1 = transpose_image(x["depth_at_t_1"])
         ego_map_gt_at_t_1 = transpose_image(x["ego_map_gt_at_t_1"])
-        st = process_image(x["rgb_at_t"], self.img_mean_t, self.img_std_t)
+        st = process_image(x["rgb_at_t"], img_mean_t, img_std_t)
         dt = transpose_image(x["depth_at_t"])
         ego_map_gt_at_t = transpose_image(x["ego_map_gt_at_t"])
         # This happens only for a baseline
@@ -552,7 +553,7 @@ class Mapper(nn.Module):
             translation = torch.stack(
                 [dx[:, 1], torch.zeros_like(dx[:, 1]), -dx[:, 0]], dim=1
             )  # (bs, 3)
-            T_world_camera2 = torch.zeros(xy_c2.shape[0], 4, 4).to(device)
+            T_world_camera2 = torch.zeros(xy_c2.shape[0], 4, 4, device=device)
             # Right-hand-rule rotation about Y axis
             cos_theta = torch.cos(-dx[:, 2])
             sin_theta = torch.sin(-dx[:, 2])
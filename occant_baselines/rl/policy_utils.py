@@ -4,18 +4,15 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
-import numpy as np
-
 import torch
-import torch_scatter
 import torch.nn as nn
 import torch.nn.functional as F
 
-from einops import rearrange
 from einops.layers.torch import Rearrange
 from occant_utils.common import (
     padded_resize,
     process_image,
+    get_img_normalization,
     init,
 )
 
@@ -34,22 +31,36 @@ class OccupancyAnticipationWrapper(nn.Module):
         self.main = model
         self.V = V
         self.input_hw = input_hw
-        self.keys_to_interpolate = [
+        self.keys_to_interpolate = (
             "ego_map_hat",
             "occ_estimate",
             "depth_proj_estimate",  # specific to RGB Model V2
-        ]
+        )
 
     def forward(self, x):
         x["rgb"] = padded_resize(x["rgb"], self.input_hw[0])
         if "ego_map_gt" in x:
             x["ego_map_gt"] = F.interpolate(x["ego_map_gt"], size=self.input_hw)
         x_full = self.main(x)
-        for k in x_full.keys():
-            if k in self.keys_to_interpolate:
-                x_full[k] = F.interpolate(
-                    x_full[k], size=(self.V, self.V), mode="bilinear"
-                )
+        # Outputs are already normalized by the model, so they only need to
+        # be resized, and only if they are not at the map resolution already.
+        keys = [
+            k
+            for k in self.keys_to_interpolate
+            if k in x_full and x_full[k].shape[2:] != (self.V, self.V)
+        ]
+        if len(keys) > 0:
+            # Resize all outputs together by stacking them along the batch. All
+            # outputs are 2-channel maps of the same size, and splitting along the
+            # batch keeps each resized output contiguous.
+            x_resized = F.interpolate(
+                torch.cat([x_full[k] for k in keys], dim=0),
+                size=(self.V, self.V),
+                mode="bilinear",
+            )
+            x_resized = torch.split(x_resized, [x_full[k].shape[0] for k in keys], 0)
+            for k, v in zip(keys, x_resized):
+                x_full[k] = v
         return x_full
 
 
@@ -335,8 +346,9 @@ class CNNBase(NNBase):
             nn.init.calculate_gain("relu"),
         )
 
-        self.img_mean = img_mean
-        self.img_std = img_std
+        # Build the normalization tensors once instead of on every forward pass
+        self.img_mean_t = torch.Tensor(img_mean).view(1, -1, 1, 1)
+        self.img_std_t = torch.Tensor(img_std).view(1, -1, 1, 1)
         imH, imW = input_shape
 
         embedding_size = 0
@@ -403,7 +415,8 @@ class CNNBase(NNBase):
 
     def forward(self, inputs, rnn_hxs, masks):
         x_rgb = inputs["rgb_at_t"]
-        x_rgb = process_image(x_rgb, self.img_mean, self.img_std)
+        img_mean_t, img_std_t = get_img_normalization(self, x_rgb.device)
+        x_rgb = process_image(x_rgb, img_mean_t, img_std_t)
         x_goal = inputs["goal_at_t"]
         x_time = inputs["t"].squeeze(1)
 
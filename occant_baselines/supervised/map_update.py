@@ -221,17 +221,18 @@ def map_update_fn(ps_args):
         nn.utils.clip_grad_norm_(mapper.parameters(), max_grad_norm)
         optimizer.step()
 
-        losses["total_loss"] += total_loss.item()
-        losses["mapping_loss"] += mapping_loss.item()
-        losses["trans_loss"] += trans_loss.item()
-        losses["rot_loss"] += rot_loss.item()
+        # Accumulate on the device to avoid a GPU -> CPU sync for every batch
+        losses["total_loss"] += total_loss.detach()
+        losses["mapping_loss"] += mapping_loss.detach()
+        losses["trans_loss"] += trans_loss.detach()
+        losses["rot_loss"] += rot_loss.detach()
 
         map_update_profile["pytorch_update"] += time.time() - start_time_pyt
         time_per_step = (time.time() - start_time) / (60 * (i + 1))
 
     losses["pose_loss"] = losses["trans_loss"] + losses["rot_loss"]
     for k in losses.keys():
-        losses[k] /= num_update_batches
+        losses[k] = float(losses[k]) / num_update_batches
 
     return losses
 
@@ -296,6 +296,24 @@ def transpose_image(img):
     return img_p
 
 
+def get_img_normalization(module, device):
+    """
+    Returns the image normalization constants of a module on the given device.
+    The constants are moved to the device once and cached on the module instead
+    of being copied on every call.
+    Inputs:
+        module - object with img_mean_t and img_std_t tensor attributes
+        device - device of the images to normalize
+
+    Outputs:
+        img_mean_t, img_std_t - (1, C, 1, 1) tensors on device
+    """
+    if module.img_mean_t.device != device:
+        module.img_mean_t = module.img_mean_t.to(device)
+        module.img_std_t = module.img_std_t.to(device)
+    return module.img_mean_t, module.img_std_t
+
+
 def process_image(img, img_mean, img_std):
     """
     Convert HWC -> CHW, normalize image.
@@ -5,6 +5,7 @@
 # LICENSE file in the root directory of this source tree.
 
 import torch
+import torch.nn.functional as F
 
 import habitat
 
@@ -18,9 +19,9 @@ from occant_baselines.models.occant import (
     OccupancyAnticipator,
 )
 
+from occant_baselines.rl.policy_utils import OccupancyAnticipationWrapper
 from occant_baselines.config.default import get_config
 
-
 TASK_CONFIG = "occant_baselines/config/ppo_exploration.yaml"
 
 
@@ -43,6 +44,7 @@ def test_ans_rgb():
     y = net(batch)
 
     assert "occ_estimate" in y.keys()
+    assert y["occ_estimate"].is_contiguous()
 
 
 def test_ans_depth():
@@ -87,6 +89,8 @@ def test_occant_rgb():
 
     assert "occ_estimate" in y.keys()
     assert "depth_proj_estimate" in y.keys()
+    assert y["occ_estimate"].is_contiguous()
+    assert y["depth_proj_estimate"].is_contiguous()
 
 
 def test_occant_depth():
@@ -189,6 +193,264 @@ def test_occupancy_anticipator():
         assert "occ_estimate" in y.keys()
 
 
+def test_occupancy_anticipator_eval():
+    bs = 4
+    V = 128
+
+    cfg = get_config(TASK_CONFIG)
+    occ_cfg = cfg.RL.ANS.OCCUPANCY_ANTICIPATOR.clone()
+    occ_cfg.defrost()
+    occ_cfg.type = "occant_rgbd"
+    occ_cfg.freeze()
+
+    net = OccupancyAnticipator(occ_cfg)
+    net.eval()
+
+    batch = {
+        "rgb": torch.rand(bs, 3, V, V),
+        "depth": torch.rand(bs, 1, V, V),
+        "ego_map_gt": torch.rand(bs, 2, V, V),
+        "ego_map_gt_anticipated": torch.rand(bs, 2, V, V),
+    }
+
+    y = net(batch)
+
+    # Outputs in eval mode are not tracked by autograd, but can be updated in-place
+    assert not y["occ_estimate"].requires_grad
+    y["occ_estimate"][:, 0].clamp_(0.1, 0.9)
+    assert torch.all(y["occ_estimate"][:, 0] >= 0.1)
+
+
+def test_occupancy_anticipation_wrapper():
+    bs = 4
+    H = 128
+
+    cfg = get_config(TASK_CONFIG)
+    occ_cfg = cfg.RL.ANS.OCCUPANCY_ANTICIPATOR.clone()
+    occ_cfg.defrost()
+    occ_cfg.type = "occant_rgb"
+    occ_cfg.freeze()
+
+    net = OccupancyAnticipator(occ_cfg)
+    net.eval()
+
+    batch = {
+        "rgb": torch.rand(bs, 3, H, H),
+        "depth": torch.rand(bs, 1, H, H),
+        "ego_map_gt": torch.rand(bs, 2, H, H),
+        "ego_map_gt_anticipated": torch.rand(bs, 2, H, H),
+    }
+
+    y_full = net(dict(batch))
+
+    # V = 101 resizes the outputs, V = 128 returns them as they are
+    for V in [101, 128]:
+        wrapper = OccupancyAnticipationWrapper(net, V, (H, H))
+        y = wrapper(dict(batch))
+
+        for k in ["occ_estimate", "depth_proj_estimate"]:
+            y_k = F.interpolate(y_full[k], size=(V, V), mode="bilinear")
+            assert y[k].shape == (bs, 2, V, V)
+            assert y[k].is_contiguous()
+            assert torch.allclose(y[k], y_k, atol=1e-6)
+            y[k].view(bs, -1)
+
+
+def test_fuse_for_inference():
+    bs = 4
+    V = 128
+
+    cfg = get_config(TASK_CONFIG)
+    occ_cfg = cfg.RL.ANS.OCCUPANCY_ANTICIPATOR
+
+    net = OccAntRGB(occ_cfg)
+    net.eval()
+
+    batch = {
+        "rgb": torch.rand(bs, 3, V, V),
+        "depth": torch.rand(bs, 1, V, V),
+        "ego_map_gt": torch.rand(bs, 2, V, V),
+        "ego_map_gt_anticipated": torch.rand(bs, 2, V, V),
+    }
+
+    with torch.no_grad():
+        y = net(batch)
+        net.fuse_for_inference()
+        y_fused = net(batch)
+
+    assert not any(isinstance(m, torch.nn.BatchNorm2d) for m in net.modules())
+    for k in y.keys():
+        assert torch.allclose(y[k], y_fused[k], atol=1e-5)
+
+
+def test_ans_rgb_transposed_conv():
+    bs = 4
+    V = 128
+
+    cfg = get_config(TASK_CONFIG)
+    occ_cfg = cfg.RL.ANS.OCCUPANCY_ANTICIPATOR.clone()
+    occ_cfg.defrost()
+    occ_cfg.GP_ANTICIPATION.ans_rgb_upsampling = "transposed_conv"
+    occ_cfg.freeze()
+
+    net = ANSRGB(occ_cfg)
+    net.eval()
+
+    batch = {
+        "rgb": torch.rand(bs, 3, V, V),
+        "depth": torch.rand(bs, 1, V, V),
+        "ego_map_gt": torch.rand(bs, 2, V, V),
+        "ego_map_gt_anticipated": torch.rand(bs, 2, V, V),
+    }
+
+    with torch.no_grad():
+        y = net(batch)
+        net.fuse_for_inference()
+        y_fused = net(batch)
+
+    assert y["occ_estimate"].shape == (bs, 2, V, V)
+    assert not any(isinstance(m, torch.nn.BatchNorm2d) for m in net.modules())
+    assert torch.allclose(y["occ_estimate"], y_fused["occ_estimate"], atol=1e-5)
+
+
+def test_prepare_for_inference():
+    bs = 4
+    V = 128
+
+    cfg = get_config(TASK_CONFIG)
+    occ_cfg = cfg.RL.ANS.OCCUPANCY_ANTICIPATOR.clone()
+    occ_cfg.defrost()
+    occ_cfg.type = "occant_rgbd"
+    occ_cfg.freeze()
+
+    net = OccupancyAnticipator(occ_cfg)
+    net.eval()
+
+    batch = {
+        "rgb": torch.rand(bs, 3, V, V),
+        "depth": torch.rand(bs, 1, V, V),
+        "ego_map_gt": torch.rand(bs, 2, V, V),
+        "ego_map_gt_anticipated": torch.rand(bs, 2, V, V),
+    }
+
+    with torch.no_grad():
+        y = net(batch)
+        net.prepare_for_inference()
+        y_prepared = net(batch)
+
+    assert not net.training
+    assert torch.allclose(y["occ_estimate"], y_prepared["occ_estimate"], atol=1e-5)
+
+
+def test_output_normalization():
+    bs = 4
+    V = 128
+
+    cfg = get_config(TASK_CONFIG)
+    occ_cfg = cfg.RL.ANS.OCCUPANCY_ANTICIPATOR
+
+    batch = {
+        "rgb": torch.rand(bs, 3, V, V),
+        "depth": torch.rand(bs, 1, V, V),
+        "ego_map_gt": torch.rand(bs, 2, V, V),
+        "ego_map_gt_anticipated": torch.rand(bs, 2, V, V),
+    }
+
+    def get_norm_cfg(channel_0, channel_1):
+        occ_cfg_copy = occ_cfg.clone()
+        occ_cfg_copy.defrost()
+        occ_cfg_copy.GP_ANTICIPATION.OUTPUT_NORMALIZATION.channel_0 = channel_0
+        occ_cfg_copy.GP_ANTICIPATION.OUTPUT_NORMALIZATION.channel_1 = channel_1
+        occ_cfg_copy.freeze()
+        return occ_cfg_copy
+
+    # Softmax on both channels: each channel is a distribution over the map
+    net = OccAntDepth(get_norm_cfg("softmax", "softmax"))
+    y = net(batch)["occ_estimate"]
+    assert y.shape == (bs, 2, V, V)
+    assert torch.allclose(y.sum((2, 3)), torch.ones(bs, 2), atol=1e-4)
+
+    # Mixed softmax / sigmoid
+    net = OccAntDepth(get_norm_cfg("softmax", "sigmoid"))
+    y = net(batch)["occ_estimate"]
+    assert y.shape == (bs, 2, V, V)
+    assert torch.allclose(y[:, 0].sum((1, 2)), torch.ones(bs), atol=1e-4)
+    assert torch.all((y[:, 1] >= 0) & (y[:, 1] <= 1))
+
+    # Unknown normalization
+    try:
+        OccAntDepth(get_norm_cfg("softmax", "tanh"))
+    except ValueError:
+        pass
+    else:
+        assert False, "Expected ValueError for an invalid output normalization"
+
+
+def test_quantize_depth_proj_estimator():
+    from torch.ao.nn.quantized import Conv2d as QuantizedConv2d
+
+    bs = 4
+    V = 128
+
+    cfg = get_config(TASK_CONFIG)
+    occ_cfg = cfg.RL.ANS.OCCUPANCY_ANTICIPATOR.clone()
+    occ_cfg.defrost()
+    occ_cfg.type = "occant_rgb"
+    occ_cfg.GP_ANTICIPATION.freeze_depth_proj_model = True
+    occ_cfg.freeze()
+
+    net = OccAntRGB(occ_cfg)
+    net.eval()
+
+    batch = {
+        "rgb": torch.rand(bs, 3, V, V),
+        "depth": torch.rand(bs, 1, V, V),
+        "ego_map_gt": torch.rand(bs, 2, V, V),
+        "ego_map_gt_anticipated": torch.rand(bs, 2, V, V),
+    }
+    calibration_batches = [torch.rand(bs, 3, V, V) for _ in range(4)]
+
+    with torch.no_grad():
+        y = net(batch)
+        net.quantize_depth_proj_estimator(calibration_batches)
+        y_quantized = net(batch)
+
+    assert any(
+        isinstance(m, QuantizedConv2d)
+        for m in net.gp_depth_proj_estimator.main.modules()
+    )
+    assert torch.allclose(
+        y["depth_proj_estimate"], y_quantized["depth_proj_estimate"], atol=1e-3
+    )
+
+    def assert_value_error(quantize, calibration_batches):
+        try:
+            quantize(calibration_batches)
+        except ValueError:
+            pass
+        else:
+            assert False, "Expected ValueError from quantize_depth_proj_estimator"
+
+    # The depth projection model is not frozen
+    occ_cfg_unfrozen = occ_cfg.clone()
+    occ_cfg_unfrozen.defrost()
+    occ_cfg_unfrozen.GP_ANTICIPATION.freeze_depth_proj_model = False
+    occ_cfg_unfrozen.freeze()
+    net = OccAntRGB(occ_cfg_unfrozen)
+    assert_value_error(net.quantize_depth_proj_estimator, calibration_batches)
+
+    # The depth projection model was already scripted
+    anticipator = OccupancyAnticipator(occ_cfg)
+    anticipator.prepare_for_inference()
+    assert_value_error(
+        anticipator.main.quantize_depth_proj_estimator, calibration_batches
+    )
+
+    # No calibration batches
+    net = OccAntRGB(occ_cfg)
+    assert_value_error(net.quantize_depth_proj_estimator, [])
+
+
 if __name__ == "__main__":
     test_ans_rgb()
     test_ans_depth()
@@ -197,3 +459,10 @@ if __name__ == "__main__":
     test_occant_rgbd()
     test_occant_ground_truth()
     test_occupancy_anticipator()
+    test_occupancy_anticipator_eval()
+    test_occupancy_anticipation_wrapper()
+    test_fuse_for_inference()
+    test_ans_rgb_transposed_conv()
+    test_prepare_for_inference()
+    test_output_normalization()
+    test_quantize_depth_proj_estimator()
@@ -46,7 +46,8 @@ def test_unet_decoder():
     y = unet_encoder(x)
     z = unet_decoder(y)
 
-    assert True
+    assert y.x5.shape == (bs, nsf * 8, V // 16, V // 16)
+    assert z.shape == (bs, n_classes, V, V)
 
 
 def test_mini_unet_encoder():
@@ -92,6 +93,25 @@ def test_merge_multimodal():
     assert True
 
 
+def test_merge_multimodal_preconcat():
+    nfeats = 64
+    bs = 4
+    V = 32
+    nmodes = 2
+
+    net = MergeMultimodal(nfeats, nmodes=nmodes)
+    net.eval()
+
+    x1 = torch.randn(bs, nfeats, V, V)
+    x2 = torch.randn(bs, nfeats, V, V)
+
+    with torch.no_grad():
+        y = net(x1, x2)
+        y_preconcat = net(torch.cat([x1, x2], dim=1))
+
+    assert torch.allclose(y, y_preconcat)
+
+
 def test_resnet_rgb_encoder():
     resnet_types = ["resnet18", "resnet50"]
 
@@ -115,4 +135,5 @@ if __name__ == "__main__":
     test_mini_unet_encoder()
     test_learned_rgb_projection()
     test_merge_multimodal()
+    test_merge_multimodal_preconcat()
     test_resnet_rgb_encoder()